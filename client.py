@@ -1,17 +1,22 @@
 import socket
-import json
 import hashlib
 import struct
 import os
 import time
 
-CHUNK_SIZE = 1024
-BUFFER_SIZE = 4096
+CHUNK_SIZE = 65536
+BUFFER_SIZE = 65536
 SERVER_HOST = "localhost"
 SERVER_PORT = 8888
 TIMEOUT = 30
 MAX_RETRIES = 3
 
+# Upload metadata: filename length, file size (filename bytes follow)
+UPLOAD_META_FMT = "!HQ"
+# Transfer metadata: file size, total chunks, chunk size, raw SHA-256 digest
+# (filename length and filename bytes follow)
+TRANSFER_META_FMT = "!QIQ32s"
+
 
 class FileTransferClient:
     """Client class for sending files and receiving chunked data."""
@@ -19,6 +24,9 @@ class FileTransferClient:
     def __init__(self, server_host: str = SERVER_HOST, server_port: int = SERVER_PORT):
         self.server_host = server_host
         self.server_port = server_port
+        # Reusable scratch buffer for headers and metadata reads
+        self._rxbuf = bytearray(BUFFER_SIZE)
+        self._rxmv = memoryview(self._rxbuf)
 
     def transfer_file(self, file_path: str) -> bool:
         """Transfer a file to the server and receive it back in chunks."""
@@ -29,6 +37,9 @@ class FileTransferClient:
         try:
             # Connect to server
             client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 20)
+            client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
             client_socket.settimeout(TIMEOUT)
             client_socket.connect((self.server_host, self.server_port))
 
@@ -58,25 +69,19 @@ class FileTransferClient:
         """Send file to server."""
         try:
             filename = os.path.basename(file_path)
-
-            with open(file_path, "rb") as f:
-                file_data = f.read()
+            file_size = os.path.getsize(file_path)
 
             # Send metadata
-            metadata = {"filename": filename, "file_size": len(file_data)}
-
-            metadata_json = json.dumps(metadata).encode("utf-8")
-            metadata_length = struct.pack("!I", len(metadata_json))
-            client_socket.send(metadata_length + metadata_json)
+            name_bytes = filename.encode("utf-8")
+            metadata = struct.pack(UPLOAD_META_FMT, len(name_bytes), file_size)
+            client_socket.sendall(metadata + name_bytes)
 
-            # Send file data
-            bytes_sent = 0
-            while bytes_sent < len(file_data):
-                chunk = file_data[bytes_sent : bytes_sent + BUFFER_SIZE]
-                sent = client_socket.send(chunk)
-                bytes_sent += sent
+            # Send file data via the kernel zero-copy path
+            if file_size:
+                with open(file_path, "rb") as f:
+                    client_socket.sendfile(f, 0, file_size)
 
-            print(f"Sent file '{filename}' ({len(file_data)} bytes)")
+            print(f"Sent file '{filename}' ({file_size} bytes)")
             return True
 
         except Exception as e:
@@ -89,32 +94,37 @@ class FileTransferClient:
         """Receive file back in chunks and verify integrity."""
         try:
             # Receive transfer metadata
-            transfer_info = self.receive_json(client_socket)
-            if not transfer_info:
+            meta = self.recv_exact(client_socket, struct.calcsize(TRANSFER_META_FMT))
+            if not meta:
                 return False
 
-            filename = transfer_info["filename"]
-            total_chunks = transfer_info["total_chunks"]
-            expected_checksum = transfer_info["checksum"]
-            file_size = transfer_info["file_size"]
+            file_size, total_chunks, chunk_size, expected_checksum = struct.unpack(
+                TRANSFER_META_FMT, meta
+            )
+            name_len = struct.unpack("!H", self.recv_exact(client_socket, 2))[0]
+            filename = self.recv_exact(client_socket, name_len).decode("utf-8")
 
             print(f"Receiving '{filename}' in {total_chunks} chunks")
-            print(f"Expected checksum: {expected_checksum}")
+            print(f"Expected checksum: {expected_checksum.hex()}")
+
+            # Preallocate the full file buffer; chunks land at their offset
+            file_data = bytearray(file_size)
 
-            # Receive chunks with retry logic
-            chunks = self.receive_chunks_with_retry(client_socket, total_chunks)
+            # Receive chunks with retry logic, hashing each chunk as it lands
+            hasher = hashlib.sha256()
+            received = self.receive_chunks_with_retry(
+                client_socket, total_chunks, chunk_size, memoryview(file_data), hasher
+            )
 
-            if len(chunks) != total_chunks:
+            received_count = sum(received)
+            if received_count != total_chunks:
                 print(
-                    f"Error: Missing chunks. Expected {total_chunks}, got {len(chunks)}"
+                    f"Error: Missing chunks. Expected {total_chunks}, got {received_count}"
                 )
                 return False
 
-            # Reassemble file
-            reassembled_data = self.reassemble_chunks(chunks, total_chunks)
-
             # Verify checksum
-            calculated_checksum = hashlib.sha256(reassembled_data).hexdigest()
+            calculated_checksum = hasher.digest()
 
             if calculated_checksum == expected_checksum:
                 print("✓ Transfer Successful - Checksum verified!")
@@ -122,14 +132,14 @@ class FileTransferClient:
                 # Save reassembled file
                 output_path = f"received_{filename}"
                 with open(output_path, "wb") as f:
-                    f.write(reassembled_data)
+                    f.write(file_data)
                 print(f"File saved as '{output_path}'")
 
                 return True
             else:
                 print("✗ Transfer Failed - Checksum mismatch!")
-                print(f"Expected: {expected_checksum}")
-                print(f"Calculated: {calculated_checksum}")
+                print(f"Expected: {expected_checksum.hex()}")
+                print(f"Calculated: {calculated_checksum.hex()}")
                 return False
 
         except Exception as e:
@@ -137,52 +147,62 @@ class FileTransferClient:
             return False
 
     def receive_chunks_with_retry(
-        self, client_socket: socket.socket, total_chunks: int
-    ) -> dict[int, bytes]:
-        """Receive chunks with retry logic for missing/corrupted chunks."""
-        chunks = {}
-        missing_chunks = set()
+        self,
+        client_socket: socket.socket,
+        total_chunks: int,
+        chunk_size: int,
+        out_view: memoryview,
+        hasher,
+    ) -> bytearray:
+        """Receive chunks into out_view with retry logic for missing chunks.
+
+        Feeds each chunk to hasher on arrival and returns a bitmap with one
+        byte per chunk, set when the chunk arrived.
+        """
+        received = bytearray(total_chunks)
+        remaining = total_chunks
         retry_count = 0
 
         while retry_count < MAX_RETRIES:
             # Receive available chunks
             while True:
                 try:
-                    chunk_packet = self.receive_json(client_socket)
-                    if not chunk_packet:
+                    header = self.recv_exact(client_socket, 4)
+                    if not header:
                         break
 
-                    seq_num = chunk_packet["seq_num"]
+                    seq_num = struct.unpack("!i", header)[0]
 
                     # End of transmission marker
                     if seq_num == -1:
                         break
 
-                    chunk_data = bytes.fromhex(chunk_packet["data"])
+                    # Write the chunk straight to its offset in the output;
+                    # every chunk is chunk_size bytes except the last
+                    offset = seq_num * chunk_size
+                    size = min(chunk_size, len(out_view) - offset)
+                    if not self.recv_into_exact(
+                        client_socket, out_view[offset : offset + size]
+                    ):
+                        break
 
-                    # Verify chunk integrity (simple size check)
-                    if len(chunk_data) == chunk_packet["size"]:
-                        chunks[seq_num] = chunk_data
-                        if seq_num in missing_chunks:
-                            missing_chunks.remove(seq_num)
-                    else:
-                        print(f"Corrupted chunk {seq_num} detected")
-                        missing_chunks.add(seq_num)
+                    hasher.update(out_view[offset : offset + size])
+                    if not received[seq_num]:
+                        received[seq_num] = 1
+                        remaining -= 1
 
                 except Exception as e:
                     print(f"Error receiving chunk: {e}")
                     break
 
-            # Check for missing chunks
-            received_seq_nums = set(chunks.keys())
-            expected_seq_nums = set(range(total_chunks))
-            missing_chunks.update(expected_seq_nums - received_seq_nums)
-
-            if not missing_chunks:
+            if not remaining:
                 break
 
+            # Only scan for the missing indices when something is missing
+            missing_chunks = [i for i, flag in enumerate(received) if not flag]
+
             print(
-                f"Missing chunks: {sorted(missing_chunks)} (Retry {retry_count + 1}/{MAX_RETRIES})"
+                f"Missing chunks: {missing_chunks} (Retry {retry_count + 1}/{MAX_RETRIES})"
             )
             retry_count += 1
 
@@ -190,40 +210,27 @@ class FileTransferClient:
                 # Request retransmission (in a real implementation)
                 time.sleep(1)  # Wait before retry
 
-        return chunks
-
-    def reassemble_chunks(self, chunks: dict[int, bytes], total_chunks: int) -> bytes:
-        """Reassemble chunks in correct order."""
-        reassembled_data = b""
+        return received
 
-        for seq_num in range(total_chunks):
-            if seq_num in chunks:
-                reassembled_data += chunks[seq_num]
-            else:
-                raise Exception(f"Missing chunk {seq_num}")
-
-        return reassembled_data
-
-    def receive_json(self, client_socket: socket.socket):
-        """Receive JSON data with length prefix."""
-        try:
-            # Receive length
-            length_data = client_socket.recv(4)
-            if len(length_data) != 4:
-                return None
-
-            length = struct.unpack("!I", length_data)[0]
-
-            # Receive JSON data
-            json_data = b""
-            while len(json_data) < length:
-                chunk = client_socket.recv(length - len(json_data))
-                if not chunk:
-                    return None
-                json_data += chunk
-
-            return json.loads(json_data.decode("utf-8"))
-
-        except Exception as e:
-            print(f"Error receiving JSON: {e}")
+    def recv_into_exact(self, client_socket: socket.socket, view: memoryview) -> bool:
+        """Fill the given memoryview completely from the socket."""
+        pos = 0
+        num_bytes = len(view)
+        while pos < num_bytes:
+            received = client_socket.recv_into(view[pos:], num_bytes - pos)
+            if not received:
+                return False
+            pos += received
+        return True
+
+    def recv_exact(self, client_socket: socket.socket, num_bytes: int):
+        """Receive exactly num_bytes from the socket, reusing the scratch buffer."""
+        if num_bytes <= len(self._rxbuf):
+            view = self._rxmv[:num_bytes]
+        else:
+            # Payload larger than the scratch buffer; fall back to a one-shot
+            view = memoryview(bytearray(num_bytes))
+
+        if not self.recv_into_exact(client_socket, view):
             return None
+        return bytes(view)
@@ -1,158 +1,219 @@
 import socket
 
-import threading
+import asyncio
 import hashlib
-import json
 
-import time
+import os
+import mmap
 import random
 import struct
+import tempfile
 
 
-CHUNK_SIZE = 1024
-BUFFER_SIZE = 4096
+CHUNK_SIZE = 65536
+BUFFER_SIZE = 65536
 SERVER_HOST = "localhost"
 SERVER_PORT = 8888
 TIMEOUT = 30
 MAX_RETRIES = 3
+SEND_BATCH = 64
+
+# Upload metadata: filename length, file size (filename bytes follow)
+UPLOAD_META_FMT = "!HQ"
+# Transfer metadata: file size, total chunks, chunk size, raw SHA-256 digest
+# (filename length and filename bytes follow)
+TRANSFER_META_FMT = "!QIQ32s"
 
 
 class Server:
     def __init__(self, host: str = SERVER_HOST, port: int = SERVER_PORT):
         self.host = host
         self.port = port
-        self.socket = None
         self.simulate_errors = False
         self.packet_loss = 0.5
 
     def start(self, simulation_errors=False):
         self.simulate_errors = simulation_errors
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 
         try:
-            self.socket.bind((self.host, self.port))
-            self.socket.listen(5)
-            print(f"Server listening on {self.host}:{self.port}")
-            print(f"Error simulation: {'ON' if simulation_errors else 'OFF'}")
-
-            while True:
-                client_socket, addr = self.socket.accept()
-                print(f"Connection from {addr}")
-
-                # Handle each client in a separate thread
-                client_thread = threading.Thread(
-                    target=self.handle_client, args=(client_socket, addr)
-                )
-                client_thread.daemon = True
-                client_thread.start()
-
+            asyncio.run(self.serve())
         except KeyboardInterrupt:
             print("\nServer shutting down...")
         except OSError as e:
             print(e)
-        finally:
-            if self.socket:
-                self.socket.close()
 
-    def handle_client(self, client_socket: socket.socket, addr: tuple):
+    async def serve(self):
+        server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        print(f"Server listening on {self.host}:{self.port}")
+        print(f"Error simulation: {'ON' if self.simulate_errors else 'OFF'}")
+
+        async with server:
+            await server.serve_forever()
+
+    async def handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
         """Handle individual client connections."""
+        addr = writer.get_extra_info("peername")
+        sock = writer.get_extra_info("socket")
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 20)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        print(f"Connection from {addr}")
+
+        spool = None
         try:
             # Receive file from client
-            file_data = self.receive_file(client_socket)
+            file_data = await self.receive_file(reader)
             if not file_data:
                 return
 
-            filename, data = file_data
-            print(f"Received file '{filename}' ({len(data)} bytes) from {addr}")
+            filename, spool, file_size, checksum = file_data
+            print(f"Received file '{filename}' ({file_size} bytes) from {addr}")
 
             # Process and send back the file in chunks
-            self.process_and_send_file(client_socket, filename, data)
+            await self.process_and_send_file(
+                writer, filename, spool, file_size, checksum
+            )
 
         except Exception as e:
             print(f"Error handling client {addr}: {e}")
         finally:
-            client_socket.close()
+            if spool is not None:
+                spool.close()
+            writer.close()
 
-    def receive_file(self, client_socket: socket.socket):
-        """Receive file from client."""
+    async def receive_file(self, reader: asyncio.StreamReader):
+        """Receive file from client into a spool file."""
+        spool = None
         try:
             # Receive metadata (filename and file size)
-            metadata_size = struct.unpack("!I", client_socket.recv(4))[0]
-            metadata_json = client_socket.recv(metadata_size).decode("utf-8")
-            metadata = json.loads(metadata_json)
-            print(metadata)
-
-            filename = metadata["filename"]
-            file_size = metadata["file_size"]
-
-            # Receive file data
-            file_data = b""
+            meta = await reader.readexactly(struct.calcsize(UPLOAD_META_FMT))
+            name_len, file_size = struct.unpack(UPLOAD_META_FMT, meta)
+            filename = (await reader.readexactly(name_len)).decode("utf-8")
+            print(f"Receiving '{filename}' ({file_size} bytes)")
+
+            # Spool file data to an in-memory file, hashing as it arrives;
+            # the fast send path re-transmits it with kernel sendfile
+            spool = self._spool_file(filename)
+            hasher = hashlib.sha256()
             bytes_received = 0
 
             while bytes_received < file_size:
-                chunk = client_socket.recv(min(BUFFER_SIZE, file_size - bytes_received))
-                if not chunk:
+                data = await reader.read(min(BUFFER_SIZE, file_size - bytes_received))
+                if not data:
                     break
-                file_data += chunk
-                bytes_received += len(chunk)
+                spool.write(data)
+                hasher.update(data)
+                bytes_received += len(data)
+
+            spool.flush()
 
             if bytes_received != file_size:
                 raise Exception(
                     f"File size mismatch: expected {file_size}, got {bytes_received}"
                 )
 
-            return filename, file_data
+            return filename, spool, file_size, hasher.digest()
 
         except Exception as e:
             print(f"Error receiving file: {e}")
+            if spool is not None:
+                spool.close()
             return None
 
-    def process_and_send_file(
-        self, client_socket: socket.socket, filename: str, data: bytes
+    def _spool_file(self, name: str):
+        """Create an anonymous in-memory file backing the received data."""
+        if hasattr(os, "memfd_create"):
+            return os.fdopen(os.memfd_create(name), "w+b")
+        return tempfile.TemporaryFile()
+
+    async def process_and_send_file(
+        self,
+        writer: asyncio.StreamWriter,
+        filename: str,
+        spool,
+        file_size: int,
+        checksum: bytes,
     ):
         """Split file into chunks and send with checksum."""
         try:
-            # Calculate checksum
-            checksum = hashlib.sha256(data).hexdigest()
-            print(f"File checksum: {checksum}")
+            print(f"File checksum: {checksum.hex()}")
 
-            # Split into chunks
-            chunks = self.split_into_chunks(data)
-            total_chunks = len(chunks)
+            total_chunks = (file_size + CHUNK_SIZE - 1) // CHUNK_SIZE
 
             print(f"Split file into {total_chunks} chunks")
 
-            # Send transfer metadata
-            transfer_info = {
-                "filename": filename,
-                "total_chunks": total_chunks,
-                "chunk_size": CHUNK_SIZE,
-                "checksum": checksum,
-                "file_size": len(data),
-            }
-
-            self.send_json(client_socket, transfer_info)
-
-            # Send chunks with sequence numbers
-            self.send_chunks(client_socket, chunks)
+            # Send transfer metadata as a fixed struct header plus filename
+            name_bytes = filename.encode("utf-8")
+            transfer_info = struct.pack(
+                TRANSFER_META_FMT, file_size, total_chunks, CHUNK_SIZE, checksum
+            ) + struct.pack("!H", len(name_bytes)) + name_bytes
+
+            writer.write(transfer_info)
+            await writer.drain()
+
+            # Send chunks with sequence numbers; the common case echoes the
+            # spool file with kernel sendfile, while the simulated path maps
+            # it into memory so chunks can be dropped or corrupted
+            if self.simulate_errors:
+                if file_size:
+                    mm = mmap.mmap(
+                        spool.fileno(), file_size, access=mmap.ACCESS_READ
+                    )
+                    try:
+                        await self._send_chunks_simulated(
+                            writer, self.split_into_chunks(mm)
+                        )
+                    finally:
+                        mm.close()
+                else:
+                    await self._send_chunks_simulated(writer, [])
+            else:
+                await self._send_chunks_fast(writer, spool, file_size, total_chunks)
 
         except Exception as e:
             print(f"Error processing file: {e}")
 
-    def split_into_chunks(self, data: bytes) -> list[bytes]:
-        """Split data into fixed-size chunks."""
-        chunks = []
-        for i in range(0, len(data), CHUNK_SIZE):
-            chunks.append(data[i : i + CHUNK_SIZE])
-        return chunks
+    def split_into_chunks(self, data) -> list[memoryview]:
+        """Split a buffer into fixed-size zero-copy chunk views."""
+        view = memoryview(data)
+        return [view[i : i + CHUNK_SIZE] for i in range(0, len(view), CHUNK_SIZE)]
+
+    async def _send_chunks_fast(
+        self,
+        writer: asyncio.StreamWriter,
+        spool,
+        file_size: int,
+        total_chunks: int,
+    ):
+        """Echo chunks straight from the spool file with kernel sendfile."""
+        loop = asyncio.get_running_loop()
+        offset = 0
+
+        for seq_num in range(total_chunks):
+            size = min(CHUNK_SIZE, file_size - offset)
+
+            # Binary chunk packet: sequence number followed by raw payload;
+            # the chunk length is implied by file_size and chunk_size
+            writer.write(struct.pack("!i", seq_num))
+            await loop.sendfile(writer.transport, spool, offset, size)
+            offset += size
+
+        # Send end-of-transmission marker
+        writer.write(struct.pack("!i", -1))
+        await writer.drain()
 
-    def send_chunks(self, client_socket: socket.socket, chunks: list[bytes]):
+    async def _send_chunks_simulated(
+        self, writer: asyncio.StreamWriter, chunks: list[memoryview]
+    ):
         """Send chunks with sequence numbers and error simulation."""
+        pending = 0
+
         for seq_num, chunk in enumerate(chunks):
             try:
                 # Simulate packet loss/corruption
-                if self.simulate_errors and random.random() < self.packet_loss:
+                if random.random() < self.packet_loss:
                     if random.choice([True, False]):  # 50% loss, 50% corruption
                         print(f"Simulating packet loss for chunk {seq_num}")
                         continue  # Skip sending this chunk
@@ -160,25 +221,27 @@ class Server:
                         print(f"Simulating packet corruption for chunk {seq_num}")
                         chunk = self.corrupt_data(chunk)
 
-                # Create chunk packet
-                chunk_packet = {
-                    "seq_num": seq_num,
-                    "data": chunk.hex(),  # Convert to hex for JSON serialization
-                    "size": len(chunk),
-                }
+                # Binary chunk packet: sequence number followed by raw payload
+                writer.write(struct.pack("!i", seq_num))
+                writer.write(chunk)
+                pending += 1
 
-                self.send_json(client_socket, chunk_packet)
-                time.sleep(0.01)  # Small delay to simulate network latency
+                # Flush a batch of chunks at a time
+                if pending >= SEND_BATCH:
+                    await writer.drain()
+                    pending = 0
+
+                await asyncio.sleep(0.01)  # Small delay to simulate latency
 
             except Exception as e:
                 print(f"Error sending chunk {seq_num}: {e}")
                 break
 
         # Send end-of-transmission marker
-        end_packet = {"seq_num": -1, "data": "", "size": 0}
-        self.send_json(client_socket, end_packet)
+        writer.write(struct.pack("!i", -1))
+        await writer.drain()
 
-    def corrupt_data(self, data: bytes) -> bytes:
+    def corrupt_data(self, data: memoryview) -> bytes:
         """Simulate data corruption by flipping random bits."""
         if len(data) == 0:
             return data
@@ -191,12 +254,6 @@ class Server:
 
         return bytes(data_array)
 
-    def send_json(self, client_socket: socket.socket, data: dict):
-        """Send JSON data with length prefix."""
-        json_data = json.dumps(data).encode("utf-8")
-        length = struct.pack("!I", len(json_data))
-        client_socket.send(length + json_data)
-
 
 if __name__ == "__main__":
     server = Server()